@@ -0,0 +1,14 @@
+# Gunicorn configuration for the backend container
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:5000"
+
+# One worker process per core for parallelism across requests; threads serve concurrent requests within a worker
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = 4
+
+# Reload on source changes only in development (docker-compose sets FLASK_DEBUG=1)
+reload = os.environ.get("FLASK_DEBUG") == "1"
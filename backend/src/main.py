@@ -1,35 +1,122 @@
 # Property Investment Analysis Tool - Backend (main.py)
 
+import atexit
+import gzip
+import logging
+import operator
 import os
+import queue
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from types import MappingProxyType
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+import orjson
 from flask import Flask, request, jsonify
-from flask_cors import CORS
+from flask.json.provider import DefaultJSONProvider
 
 # Import the calculation service
-from src.services.calculation_service import perform_calculation_for_scenario, calculate_renting_scenario_cost # Added import
+from src.services.calculation_service import (
+    perform_calculation_for_scenario, calculate_renting_scenario_cost
+) # Added import
+
+# Log records are queued and written by a background thread, so request threads never block on stderr
+logger = logging.getLogger("propcalc")
+logger.setLevel(logging.DEBUG if os.environ.get("FLASK_DEBUG") == "1" else logging.WARNING)
+logger.propagate = False
+_log_queue = queue.Queue(-1)
+logger.addHandler(QueueHandler(_log_queue))
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop) # Flush queued records on shutdown
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses with orjson straight to bytes."""
+
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        # orjson accepts the raw request bytes directly, no decode step needed
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.option)
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config["SECRET_KEY"] = "your_very_secret_key_change_me"
 
-# Enable CORS for all domains on all routes
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+# CORS headers are static (any origin), so build them once instead of per request
+_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type"
+}
+# Preflight responses also let the browser cache the result and skip repeat preflights
+_CORS_PREFLIGHT_HEADERS = {**_CORS_HEADERS, "Access-Control-Max-Age": "86400"}
+
+@app.after_request
+def add_cors_headers(response):
+    # Only the API is cross-origin; a fixed prefix needs a startswith check, not a regex match
+    if request.path.startswith("/api/"):
+        response.headers.update(_CORS_PREFLIGHT_HEADERS if request.method == "OPTIONS" else _CORS_HEADERS)
+    return response
+
+# Buffered responses smaller than this aren't worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+@app.after_request
+def compress_response(response):
+    """Gzips large buffered responses (multi-scenario JSON compresses well) for clients that accept it."""
+    if (response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or (response.content_length or 0) < COMPRESS_MIN_SIZE
+            or not request.accept_encodings["gzip"]):
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
+# Shared worker pool for per-scenario calculations (created once, reused across requests)
+EXECUTOR = ThreadPoolExecutor(max_workers=min(32, os.cpu_count() or 4))
+
+# Requests with at least this many scenarios stream results_by_scenario instead of buffering the whole response
+STREAM_MIN_SCENARIOS = 16
+
+# Required fields of each submitted scenario, fetched in one call
+_SCENARIO_FIELDS = operator.itemgetter("id", "country", "city", "inputs")
 
 @app.route("/api/calculate", methods=["POST"])
 def calculate_investment():
     if not request.is_json:
         return jsonify({"error": "Request must be JSON"}), 400
     
-    data = request.get_json()
+    # Parsed by the orjson provider; silent so malformed bodies get a JSON error, not an HTML 400
+    data = request.get_json(silent=True)
     
+    if data is None:
+        return jsonify({"error": "Request body is not valid JSON"}), 400
     if not data:
         return jsonify({"error": "No data provided"}), 400
 
     personal_finance = data.get("personal_finance", {})
     scenario_settings = data.get("scenario_settings", {})
+    if not isinstance(personal_finance, dict) or not isinstance(scenario_settings, dict):
+        return jsonify({"error": "personal_finance and scenario_settings must be objects"}), 400
+    # Shared by every scenario: freeze them so nothing downstream can mutate (or needs to copy) them
+    personal_finance = MappingProxyType(personal_finance)
+    scenario_settings = MappingProxyType(scenario_settings)
     scenarios_data = data.get("scenarios", [])
     renting_inputs = data.get("renting_scenario_inputs") # Get renting inputs
 
@@ -39,10 +126,12 @@ def calculate_investment():
          return jsonify({"error": "Scenario settings (years_to_sell) missing"}), 400
 
     results = []
-    warnings = set() # Collect unique warnings across scenarios
+    warnings = [] # Collect warnings across scenarios; deduplicated once when building the response
     renting_results = None
     total_renting_cost = 0
 
+    # Request-level failures (renting inputs, malformed scenario list) abort the request;
+    # per-scenario failures below only mark that scenario as failed
     try:
         # Calculate renting scenario first if inputs are provided
         if renting_inputs:
@@ -50,70 +139,117 @@ def calculate_investment():
             renting_results = calculate_renting_scenario_cost(renting_inputs, scenario_settings.get("years_to_sell"))
             if renting_results.get("error"):
                 # Handle error in renting calculation if necessary, or just pass it along
-                warnings.add(f"Renting scenario calculation error: {renting_results['error']}")
+                warnings.append(f"Renting scenario calculation error: {renting_results['error']}")
             else:
                 total_renting_cost = renting_results.get("total_renting_cost", 0)
                 if renting_results.get("warnings"):
-                    warnings.update(renting_results["warnings"])
+                    warnings.extend(renting_results["warnings"])
 
+        # Scenarios are independent: validate them all first, then hand the batch to the pool at once
+        batch = [] # Scenario id of every valid scenario, in request order
+        calculation_inputs = []
         for scenario in scenarios_data:
-            scenario_id = scenario.get("id")
-            country = scenario.get("country")
-            city = scenario.get("city")
-            inputs = scenario.get("inputs")
-
-            if not all([scenario_id, country, city, inputs]):
-                results.append({"scenario_id": scenario_id, "error": "Incomplete scenario data (missing id, country, city, or inputs)"})
+            try:
+                scenario_id, country, city, inputs = _SCENARIO_FIELDS(scenario)
+                complete = all((scenario_id, country, city, inputs))
+            except KeyError:
+                complete = False
+
+            if not complete:
+                results.append({"scenario_id": scenario.get("id"), "error": "Incomplete scenario data (missing id, country, city, or inputs)"})
                 continue
             
-            calculation_input = {
+            # One dict per scenario, as the worker pool reads them after this loop
+            calculation_inputs.append({
                 "personal_finance": personal_finance,
                 "scenario_settings": scenario_settings,
                 "country": country,
                 "city": city,
                 "inputs": inputs
-            }
-            
-            scenario_result_data = perform_calculation_for_scenario(calculation_input)
-            
-            if scenario_result_data.get("calculation_details", {}).get("warnings"):
-                warnings.update(scenario_result_data["calculation_details"]["warnings"])
-            
-            # Ensure overall_summary exists in the result
-            if "overall_summary" not in scenario_result_data:
-                scenario_result_data["overall_summary"] = {"win_loss_eur": 0}
+            })
+            batch.append(scenario_id)
+            # Reserve the slot so results keep the request order
+            results.append(None)
+
+    except Exception as e:
+        logger.exception("Error during calculation")
+        return jsonify({"error": f"An error occurred during calculation: {str(e)}"}), 500
+
+    growth_rates = None # Growth rates of the first valid scenario result, reported at the root
+    # Loop-invariant: whether each scenario gets the renting baseline subtracted
+    adjust_for_renting = bool(renting_results) and not renting_results.get("error")
+
+    def scenario_entries():
+        """Yields each scenario's response entry in request order as its calculation completes."""
+        nonlocal growth_rates
+        # One future per scenario so a failing calculation doesn't abort the rest of the batch;
+        # warnings are only touched on this thread, so no lock is needed
+        futures = [EXECUTOR.submit(perform_calculation_for_scenario, calculation_input) for calculation_input in calculation_inputs]
+        computed = zip(batch, futures)
+        for entry in results:
+            if entry is not None: # Validation error recorded up front
+                yield entry
+                continue
+
+            scenario_id, future = next(computed)
+            try:
+                scenario_result_data = future.result() # A private copy, safe to annotate below
+                
+                if scenario_result_data.get("calculation_details", {}).get("warnings"):
+                    warnings.extend(scenario_result_data["calculation_details"]["warnings"])
                 
-            # Add index_adjusted_profit if renting cost is available
-            if renting_results and not renting_results.get("error"):
-                current_win_loss = scenario_result_data["overall_summary"].get("win_loss_eur", 0)
-                scenario_result_data["overall_summary"]["index_adjusted_profit_eur"] = current_win_loss - total_renting_cost
+                # Ensure overall_summary exists in the result
+                if "overall_summary" not in scenario_result_data:
+                    scenario_result_data["overall_summary"] = {"win_loss_eur": 0}
+                    
+                # Add index_adjusted_profit if renting cost is available
+                if adjust_for_renting:
+                    summary = scenario_result_data["overall_summary"]
+                    summary["index_adjusted_profit_eur"] = summary.get("win_loss_eur", 0) - total_renting_cost
+            except Exception as e:
+                logger.exception("Error during calculation of scenario %s", scenario_id)
+                yield {"scenario_id": scenario_id, "error": f"An error occurred during calculation: {str(e)}"}
+                continue
             
-            results.append({"scenario_id": scenario_id, "result": scenario_result_data})
-
-        final_response = {
-            "results_by_scenario": results,
-            "global_warnings": list(warnings)
-        }
-        
-        # Add growth rates to the root response from the first valid scenario result
-        for scenario_result in results:
-            if scenario_result.get("result") and scenario_result["result"].get("growth_rates"):
-                final_response["growth_rates"] = scenario_result["result"]["growth_rates"]
-                break
-        
+            if not growth_rates:
+                growth_rates = scenario_result_data.get("growth_rates")
+
+            yield {"scenario_id": scenario_id, "result": scenario_result_data}
+
+    def response_tail():
+        """Response fields that are only known once every scenario has been processed."""
+        tail = {"global_warnings": list(dict.fromkeys(warnings))} # Unique, in first-seen order
+        if growth_rates:
+            tail["growth_rates"] = growth_rates
         if renting_results:
-            final_response["renting_scenario_results"] = renting_results
+            tail["renting_scenario_results"] = renting_results
+        return tail
 
+    if len(batch) < STREAM_MIN_SCENARIOS:
+        final_response = {"results_by_scenario": list(scenario_entries())}
+        final_response.update(response_tail())
         return jsonify(final_response)
 
-    except Exception as e:
-        print(f"Error during calculation: {e}")
-        return jsonify({"error": f"An error occurred during calculation: {str(e)}"}), 500
+    def stream():
+        # Emit each scenario as soon as it is ready instead of holding the whole payload in memory
+        yield b'{"results_by_scenario":['
+        for i, entry in enumerate(scenario_entries()):
+            yield (b"," if i else b"") + orjson.dumps(entry, option=app.json.option)
+        # Splice the tail object's members into the enclosing object (drop its opening brace)
+        yield b"]," + orjson.dumps(response_tail(), option=app.json.option)[1:]
+
+    return app.response_class(stream(), mimetype="application/json")
+
+# The health-check body never changes, so encode it once
+_PING_BODY = orjson.dumps({"message": "Backend is running"})
 
 @app.route("/api/ping", methods=["GET"])
 def ping():
-    return jsonify({"message": "Backend is running"})
+    # A bytes body gets an exact Content-Length from Werkzeug, so it is sent without chunked framing
+    return app.response_class(_PING_BODY, mimetype="application/json")
 
+# Development server only; the container serves the app with gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Reloader and debugger only when explicitly requested (docker-compose sets FLASK_DEBUG=1)
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get("FLASK_DEBUG") == "1")
 
@@ -2,9 +2,17 @@
 
 """Core calculation logic for property investment analysis."""
 
-import datetime
-import numpy as np # For standard deviation calculations
+import json
+import logging
+import operator
+import numpy as np # For vectorized scenario calculations
+import orjson
 import math # Needed for interest calculation
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+from types import MappingProxyType
+
+from .detailed_breakdown_service import create_detailed_breakdowns
 
 # --- Default Assumptions (Placeholders - Fetch from config/db or past_knowledge later) ---
 
@@ -66,34 +74,161 @@ DEFAULT_RATES = {
     }
 }
 
+def _freeze_rate(value):
+    """Recursively converts lists to tuples and dicts to read-only mappings."""
+    if isinstance(value, list):
+        return tuple(_freeze_rate(item) for item in value)
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze_rate(item) for key, item in value.items()})
+    return value
+
+@dataclass(slots=True, frozen=True)
+class TaxTiers:
+    """Progressive rate table as read-only arrays; tax_below is the cumulative tax owed at each lower limit."""
+    limits: np.ndarray
+    lower_limits: np.ndarray
+    tax_below: np.ndarray
+    rates: np.ndarray
+
+@lru_cache(maxsize=None)
+def _tax_tiers(tiers):
+    """Converts a progressive rate table, given as (limit, rate) pairs, to TaxTiers once."""
+    limits = np.array([limit for limit, _ in tiers], dtype=np.float64)
+    tier_rates = np.array([rate for _, rate in tiers], dtype=np.float64)
+    lower_limits = np.concatenate(([0.0], limits[:-1]))
+    tax_below = np.concatenate(([0.0], np.cumsum(((limits - lower_limits) * tier_rates)[:-1])))
+    arrays = (limits, lower_limits, tax_below, tier_rates)
+    for array in arrays:
+        array.flags.writeable = False # Shared by every caller
+    return TaxTiers(*arrays)
+
+def _load_rate(key, value):
+    """Frozen form of a configured rate; progressive tax tables are converted to TaxTiers."""
+    if key == "capital_gains_tax_rate_spain":
+        return _tax_tiers(tuple((tier["limit"], tier["rate"]) for tier in value))
+    return _freeze_rate(value)
+
+@dataclass(slots=True, frozen=True)
+class RegionRates:
+    """Rates every region defines; fields mirror the DEFAULT_RATES keys."""
+    purchase_tax_vat_construction: float
+    purchase_agency_fee_rate: float
+    running_community_fee_monthly: float
+    selling_agency_fee_rate: float
+    standard_income_tax_rate: float
+    avg_appreciation_rate: float
+    appreciation_std_dev: float
+    renovation_rates: MappingProxyType
+
+@dataclass(slots=True, frozen=True)
+class SpainRates(RegionRates):
+    """Rate set of a Spanish city."""
+    purchase_tax_itp_new: float
+    purchase_tax_itp_resale: float
+    purchase_tax_ajd_construction: float
+    purchase_notary_fee_rate: float
+    purchase_registry_fee_rate: float
+    running_ibi_rate: float
+    selling_plusvalia_municipal: float
+    capital_gains_tax_rate_spain: TaxTiers
+    beckham_law_tax_rate: float
+
+@dataclass(slots=True, frozen=True)
+class DenmarkRates(RegionRates):
+    """Rate set of a Danish city."""
+    purchase_tax_tinglysningsafgift_fixed: float
+    purchase_tax_tinglysningsafgift_variable: float
+    purchase_stamp_duty_loan: float
+    purchase_stamp_duty_loan_fixed: float
+    purchase_lawyer_fee: float
+    running_property_tax_ejendomsskat: float
+    running_property_value_tax_ejendomsværdiskat: float
+    capital_gains_tax_rate_denmark: float
+
+_RATE_SCHEMAS = {"spain": SpainRates, "denmark": DenmarkRates}
+
+# DEFAULT_RATES loaded once at import into frozen per-city rate objects, so a lookup is a hash probe plus
+# a slot read and callers can share values without defensive copies
+_RATES = {
+    (country, city): _RATE_SCHEMAS[country](**{key: _load_rate(key, value) for key, value in rates.items()})
+    for country, cities in DEFAULT_RATES.items()
+    for city, rates in cities.items()
+}
+# The rate objects are built once, so freeze the source too: an edit at runtime would silently not apply
+DEFAULT_RATES = _freeze_rate(DEFAULT_RATES)
+
+_log = logging.getLogger(__name__)
+_MISSING = object() # Sentinel for rate lookups, so a configured falsy rate is told apart from a missing one
+
+@lru_cache(maxsize=1024)
+def _warn_missing_rate(key_tuple):
+    """Logs a missing rate once per key; bounded, as country/city come from the client."""
+    _log.warning("Rate not found: %s", key_tuple)
+
+# Appreciation scenarios evaluated for every calculation, in response order
+SCENARIO_NAMES = ("zero_growth", "avg_growth", "low_risk", "high_risk")
+
+# --- Result Types ---
+# Slotted so the hot path fills attributes instead of hashing dict keys; orjson serializes them as objects
+
+@dataclass(slots=True)
+class PurchaseCosts:
+    total_investment_cost: float = 0
+    initial_outlay_year0: float = 0
+    breakdown: dict = field(default_factory=dict)
+
+@dataclass(slots=True)
+class RunningCosts:
+    total: float = 0
+    breakdown_annual: dict = field(default_factory=dict)
+    breakdown_total: dict = field(default_factory=dict)
+
+@dataclass(slots=True)
+class SellingCosts:
+    total: float = 0
+    breakdown: dict = field(default_factory=dict)
+
+@dataclass(slots=True, frozen=True)
+class LoanResult:
+    """Loan figures over a holding period; all 0 when they can't be calculated."""
+    interest: float = 0
+    monthly_payment: float = 0
+    remaining_balance: float = 0
+
 # --- Helper Functions ---
 
 def get_rate(country, city, key, subkey=None):
-    """Safely retrieve a rate from the defaults."""
-    try:
-        data = DEFAULT_RATES[country][city]
-        if subkey:
-            value = data[key][subkey]
-        else:
-            value = data[key]
-        
-        # Return copies for mutable types to avoid accidental modification
-        if isinstance(value, list):
-            return list(value)
-        elif isinstance(value, dict):
-            return dict(value)
-        else:
-            return value
-            
-    except KeyError:
-        subkey_str = f" / {subkey}" if subkey else ""
-        print(f"Warning: Rate not found for {country}/{city}/{key}{subkey_str}")
-        if key == "capital_gains_tax_rate_spain": return []
-        if key == "renovation_rates": return {}
-        return 0
+    """Safely retrieve a rate from the defaults. Tables are returned as read-only tuples/mappings/TaxTiers."""
+    value = getattr(_RATES.get((country, city)), key, _MISSING)
+    if subkey and value is not _MISSING:
+        value = value.get(subkey, _MISSING)
+    if value is _MISSING:
+        _warn_missing_rate((country, city, key, subkey))
+        return _rate_default(key)
+    return value
+
+def _rate_default(key):
+    """Value of a missing rate: an empty table for the table-valued rates, 0 otherwise."""
+    if key == "capital_gains_tax_rate_spain": return ()
+    if key == "renovation_rates": return MappingProxyType({})
+    return 0
+
+def _region_rates(country, city):
+    """Rate object of a region, fetched once per calculation step instead of one get_rate per rate."""
+    rates = _RATES.get((country, city))
+    return rates if rates is not None else _fallback_rates(country, city)
+
+@lru_cache(maxsize=256)
+def _fallback_rates(country, city):
+    """Rates of an unconfigured region, all at get_rate's defaults; logged once per region while cached."""
+    _log.warning("No rates configured for %s/%s, using defaults", country, city)
+    schema = _RATE_SCHEMAS.get(country, RegionRates)
+    return schema(**{field.name: _rate_default(field.name) for field in fields(schema)})
 
 def calculate_progressive_tax(amount, rates_table):
-    """Calculates tax based on a progressive rate table."""
+    """Calculates tax based on a progressive rate table (a list of {"limit", "rate"} tiers or TaxTiers)."""
+    if isinstance(rates_table, TaxTiers):
+        return max(0, float(calculate_progressive_tax_vec(amount, rates_table)))
     if not rates_table or amount <= 0:
         return 0
     tax = 0
@@ -108,240 +243,346 @@ def calculate_progressive_tax(amount, rates_table):
         last_limit = limit
     return tax
 
+def calculate_progressive_tax_vec(amounts, rates_table):
+    """Vectorized calculate_progressive_tax over a scalar or an array of amounts.
+
+    rates_table is either a list of {"limit", "rate"} tiers or its precomputed TaxTiers.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if not isinstance(rates_table, TaxTiers):
+        if not rates_table:
+            return np.zeros_like(amounts)
+        rates_table = _tax_tiers(tuple((tier["limit"], tier["rate"]) for tier in rates_table))
+    # Non-positive and NaN amounts owe nothing, as in the scalar loop; amounts past the last limit are only taxed up to it
+    amounts = np.where(amounts > 0, np.minimum(amounts, rates_table.limits[-1]), 0.0)
+    idx = np.searchsorted(rates_table.limits, amounts, side="left")
+    return rates_table.tax_below[idx] + (amounts - rates_table.lower_limits[idx]) * rates_table.rates[idx]
+
 def calculate_future_value(present_value, rate, years):
     """Calculates future value using compound growth."""
-    return present_value * ((1 + rate) ** years)
+    if abs(rate) < 1e-9: # First-order growth is exact to double precision here
+        return present_value * (1 + rate * years)
+    if rate <= -1: # log1p is undefined here, fall back to the generic power
+        return present_value * ((1 + rate) ** years)
+    return present_value * math.exp(years * math.log1p(rate))
 
-def calculate_total_interest_paid(principal, annual_rate, term_years, holding_years):
-    """Calculates the total interest paid on a loan over a specific holding period."""
+def calculate_loan(principal, annual_rate, term_years, holding_years):
+    """Calculates the monthly payment, and the interest paid and balance left after a holding period."""
     if annual_rate <= 0 or term_years <= 0 or principal <= 0 or holding_years <= 0:
-        return 0
+        return LoanResult()
     monthly_rate = annual_rate / 12
     num_payments_total = term_years * 12
     # Ensure holding period doesn't exceed loan term for calculation
     num_payments_holding = min(holding_years * 12, num_payments_total)
 
     if monthly_rate == 0: # No interest paid if rate is 0
-        return 0
+        return LoanResult()
 
     # Calculate monthly payment using the standard formula
     # M = P [ i(1 + i)^n ] / [ (1 + i)^n – 1]
+    # Powers of (1 + i) via exp/log1p; expm1 gives (1 + i)^n - 1 without cancellation at low rates
+    log1p_i = math.log1p(monthly_rate)
     try:
-        denominator = math.pow(1 + monthly_rate, num_payments_total) - 1
+        denominator = math.expm1(num_payments_total * log1p_i)
+        pow_n = denominator + 1
         if denominator == 0: # Avoid division by zero if rate and term lead to this edge case
-            return 0 
-        monthly_payment = principal * (monthly_rate * math.pow(1 + monthly_rate, num_payments_total)) / denominator
+            return LoanResult()
+        monthly_payment = principal * (monthly_rate * pow_n) / denominator
     except (OverflowError, ValueError): 
-         print(f"Warning: Math error calculating monthly payment for P={principal}, i={monthly_rate}, n={num_payments_total}")
-         return 0 # Indicate failure to calculate
+         _log.warning("Math error calculating monthly payment for P=%s, i=%s, n=%s", principal, monthly_rate, num_payments_total)
+         return LoanResult() # Indicate failure to calculate
 
-    total_paid_holding = monthly_payment * num_payments_holding
+    # Held for the full term: the loan is paid off, so everything paid beyond the principal is interest
+    if num_payments_holding >= num_payments_total:
+        return LoanResult(max(0, monthly_payment * num_payments_holding - principal), monthly_payment)
     
-    # Calculate remaining balance after holding period
-    # B = P (1 + i)^k - M [ ((1 + i)^k - 1) / i ] where k = num_payments_holding
+    # Interest paid = M k - (P - B), with the remaining balance B = P (1 + i)^k - M [ ((1 + i)^k - 1) / i ],
+    # which simplifies to M (k - g / i) + P g where g = (1 + i)^k - 1 and k = num_payments_holding
     try:
-        remaining_balance = principal * math.pow(1 + monthly_rate, num_payments_holding) - monthly_payment * ((math.pow(1 + monthly_rate, num_payments_holding) - 1) / monthly_rate)
+        growth_k = math.expm1(num_payments_holding * log1p_i)
+        interest_paid_holding = monthly_payment * (num_payments_holding - growth_k / monthly_rate) + principal * growth_k
+        remaining_balance = principal * (growth_k + 1) - monthly_payment * (growth_k / monthly_rate)
     except (OverflowError, ValueError):
-        print(f"Warning: Math error calculating remaining balance for P={principal}, i={monthly_rate}, k={num_payments_holding}")
-        return 0 # Indicate failure to calculate
-
-    principal_paid_holding = principal - remaining_balance
-    interest_paid_holding = total_paid_holding - principal_paid_holding
+        _log.warning("Math error calculating remaining balance for P=%s, i=%s, k=%s", principal, monthly_rate, num_payments_holding)
+        return LoanResult(monthly_payment=monthly_payment)
     
-    # Return the calculated interest, ensuring it's not negative due to float precision
-    return max(0, interest_paid_holding)
+    # Clamp the interest, ensuring it's not negative due to float precision
+    return LoanResult(max(0, interest_paid_holding), monthly_payment, remaining_balance)
+
+def calculate_total_interest_paid(principal, annual_rate, term_years, holding_years):
+    """Calculates the total interest paid on a loan over a specific holding period."""
+    return calculate_loan(principal, annual_rate, term_years, holding_years).interest
 
 # --- Calculation Functions --- 
 
+def _spain_new_fee_rows(rates):
+    return [("purchase_tax_vat", rates.purchase_tax_vat_construction, 0, 0),
+            ("purchase_tax_ajd", rates.purchase_tax_ajd_construction, 0, 0)]
+
+def _spain_resale_fee_rows(rates):
+    return [("purchase_tax_itp", rates.purchase_tax_itp_resale, 0, 0)]
+
+def _spain_common_fee_rows(rates):
+    return [("notary_fee", rates.purchase_notary_fee_rate, 0, 0),
+            ("registry_fee", rates.purchase_registry_fee_rate, 0, 0)]
+
+def _denmark_new_fee_rows(rates):
+    return [("purchase_tax_vat", rates.purchase_tax_vat_construction, 0, 0)]
+
+def _denmark_resale_fee_rows(rates):
+    return [("purchase_tax_tinglysningsafgift", rates.purchase_tax_tinglysningsafgift_variable,
+             0, rates.purchase_tax_tinglysningsafgift_fixed)]
+
+def _denmark_common_fee_rows(rates):
+    return [("loan_stamp_duty", 0, rates.purchase_stamp_duty_loan, rates.purchase_stamp_duty_loan_fixed),
+            ("lawyer_fee", 0, 0, rates.purchase_lawyer_fee)]
+
+# Purchase fee lines as (label, price coefficient, loan coefficient, fixed amount) rows: the property-type
+# specific taxes come first, followed by the fees every purchase in the country pays
+_PROPERTY_TYPE_FEE_ROWS = {
+    ("spain", "under_construction"): _spain_new_fee_rows,
+    ("spain", "new"): _spain_new_fee_rows,
+    ("spain", "second_hand"): _spain_resale_fee_rows, # Changed from renovation_needed
+    ("denmark", "under_construction"): _denmark_new_fee_rows,
+    ("denmark", "new"): _denmark_new_fee_rows,
+    ("denmark", "ejer"): _denmark_resale_fee_rows,
+    ("denmark", "andels"): _denmark_resale_fee_rows,
+}
+_COMMON_FEE_ROWS = {"spain": _spain_common_fee_rows, "denmark": _denmark_common_fee_rows}
+
+@lru_cache(maxsize=256)
+def _purchase_fee_table(country, city, prop_type):
+    """Labels and (price, loan, fixed) coefficients of each purchase tax/fee line for a property type."""
+    rows = []
+    type_rows = _PROPERTY_TYPE_FEE_ROWS.get((country, prop_type))
+    common_rows = _COMMON_FEE_ROWS.get(country)
+    if type_rows or common_rows:
+        rates = _region_rates(country, city)
+        if type_rows:
+            rows += type_rows(rates)
+        if common_rows:
+            rows += common_rows(rates)
+    labels = tuple(row[0] for row in rows)
+    coefficients = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), 3)
+    return labels, coefficients
+
+def _precompute_tables():
+    """Builds the cached fee tables of every configured region at import, so no request pays for them."""
+    for (country, city), rates in _RATES.items():
+        for table_country, prop_type in _PROPERTY_TYPE_FEE_ROWS:
+            if table_country == country:
+                _purchase_fee_table(country, city, prop_type)
+
+_precompute_tables()
+
+@lru_cache(maxsize=256)
+def _purchase_breakdown_template(fee_labels, no_schedule_warning):
+    head = ("property_price", "warning_no_payment_schedule") if no_schedule_warning else ("property_price",)
+    return dict.fromkeys(head + ("initial_property_payment_year0",) + fee_labels + ("taxes_fees_year0",), 0)
+
+def _loan_amount(inputs, price):
+    try:
+        return inputs["loan_details"]["amount"]
+    except (KeyError, TypeError):
+        return price * 0.8 # Use default LTV if not provided
+
 def calculate_purchase_costs(inputs, country, city):
     """Calculates initial purchase costs, considering payment schedules for under construction."""
-    costs = {"total_investment_cost": 0, "initial_outlay_year0": 0, "breakdown": {}}
+    costs = PurchaseCosts()
     price = inputs.get("new_flat_price", 0)
     prop_type = inputs.get("property_type", "new")
-    payment_schedule = inputs.get("payment_schedule", [])
-    loan_details = inputs.get("loan_details", {})
-    loan_amount = loan_details.get("amount", price * 0.8) # Use default LTV if not provided
+    payment_schedule = inputs.get("payment_schedule", ())
     if price <= 0: return costs
+    loan_amount = _loan_amount(inputs, price)
+    no_schedule = prop_type == "under_construction" and not payment_schedule
+    fee_labels, fee_coefficients = _purchase_fee_table(country, city, prop_type)
+    # Start from a presized copy holding every always-present key in response order
+    costs.breakdown = _purchase_breakdown_template(fee_labels, no_schedule).copy()
     
-    costs["breakdown"]["property_price"] = price
-    costs["total_investment_cost"] += price
+    costs.breakdown["property_price"] = price
+    costs.total_investment_cost += price
     
     initial_payment_fraction = 1.0
     if prop_type == "under_construction" and payment_schedule:
         initial_payment_fraction = sum(p.get("percentage", 0) for p in payment_schedule if p.get("due_year", -1) == 0)
-    elif prop_type == "under_construction":
+    elif no_schedule:
         initial_payment_fraction = 0.10
-        costs["breakdown"]["warning_no_payment_schedule"] = "Assumed 10% initial payment."
+        costs.breakdown["warning_no_payment_schedule"] = "Assumed 10% initial payment."
         
     initial_property_payment = price * initial_payment_fraction
-    costs["initial_outlay_year0"] += initial_property_payment
-    costs["breakdown"]["initial_property_payment_year0"] = initial_property_payment
+    costs.initial_outlay_year0 += initial_property_payment
+    costs.breakdown["initial_property_payment_year0"] = initial_property_payment
 
-    purchase_tax_total = 0
-    ajd_tax_total = 0
-    notary_fee_total = 0
-    registry_fee_total = 0
-    loan_stamp_duty_total = 0
-    lawyer_fee_total = 0
-
-    if country == "spain":
-        if prop_type == "under_construction" or prop_type == "new":
-            purchase_tax_vat = price * get_rate(country, city, "purchase_tax_vat_construction")
-            costs["breakdown"]["purchase_tax_vat"] = purchase_tax_vat
-            purchase_tax_total += purchase_tax_vat
-            ajd_tax = price * get_rate(country, city, "purchase_tax_ajd_construction")
-            costs["breakdown"]["purchase_tax_ajd"] = ajd_tax
-            ajd_tax_total += ajd_tax
-        elif prop_type == "second_hand": # Changed from renovation_needed
-            purchase_tax_itp = price * get_rate(country, city, "purchase_tax_itp_resale")
-            costs["breakdown"]["purchase_tax_itp"] = purchase_tax_itp
-            purchase_tax_total += purchase_tax_itp
-        
-        notary_fee = price * get_rate(country, city, "purchase_notary_fee_rate")
-        costs["breakdown"]["notary_fee"] = notary_fee
-        notary_fee_total += notary_fee
-        registry_fee = price * get_rate(country, city, "purchase_registry_fee_rate")
-        costs["breakdown"]["registry_fee"] = registry_fee
-        registry_fee_total += registry_fee
+    # Every purchase tax/fee is linear in (price, loan amount, 1), so evaluate them all with one dot product
+    fees = fee_coefficients @ np.array([price, loan_amount, 1.0], dtype=np.float64)
+    fees = fees.tolist()
+    costs.breakdown.update(zip(fee_labels, fees))
+    taxes_fees = math.fsum(fees) # Summed once, exactly, and reused for every total below
         
-    elif country == "denmark":
-        if prop_type == "under_construction" or prop_type == "new": 
-            purchase_tax_vat = price * get_rate(country, city, "purchase_tax_vat_construction")
-            costs["breakdown"]["purchase_tax_vat"] = purchase_tax_vat
-            purchase_tax_total += purchase_tax_vat
-        elif prop_type == "ejer" or prop_type == "andels":
-            fixed_tax = get_rate(country, city, "purchase_tax_tinglysningsafgift_fixed")
-            variable_tax = price * get_rate(country, city, "purchase_tax_tinglysningsafgift_variable")
-            purchase_tax = fixed_tax + variable_tax
-            costs["breakdown"]["purchase_tax_tinglysningsafgift"] = purchase_tax
-            purchase_tax_total += purchase_tax
-
-        loan_stamp_duty_fixed = get_rate(country, city, "purchase_stamp_duty_loan_fixed")
-        loan_stamp_duty_variable = loan_amount * get_rate(country, city, "purchase_stamp_duty_loan")
-        loan_stamp_duty = loan_stamp_duty_fixed + loan_stamp_duty_variable
-        costs["breakdown"]["loan_stamp_duty"] = loan_stamp_duty
-        loan_stamp_duty_total += loan_stamp_duty
-        lawyer_fee = get_rate(country, city, "purchase_lawyer_fee")
-        costs["breakdown"]["lawyer_fee"] = lawyer_fee
-        lawyer_fee_total += lawyer_fee
-        
-    costs["total_investment_cost"] += (purchase_tax_total + ajd_tax_total + notary_fee_total + 
-                                       registry_fee_total + loan_stamp_duty_total + lawyer_fee_total)
-    costs["initial_outlay_year0"] += (purchase_tax_total + ajd_tax_total + notary_fee_total + 
-                                      registry_fee_total + loan_stamp_duty_total + lawyer_fee_total)
-    costs["breakdown"]["taxes_fees_year0"] = (purchase_tax_total + ajd_tax_total + notary_fee_total + 
-                                               registry_fee_total + loan_stamp_duty_total + lawyer_fee_total)
+    costs.total_investment_cost += taxes_fees
+    costs.initial_outlay_year0 += taxes_fees
+    costs.breakdown["taxes_fees_year0"] = taxes_fees
 
     # Renovations are always possible, not just for second_hand (CR1.1)
     renovation_total = 0
-    renovations = inputs.get("renovations", [])
+    renovations = inputs.get("renovations", ())
     if renovations: # Only calculate if renovations are provided
-        renovation_rates = get_rate(country, city, "renovation_rates")
-        for reno in renovations:
-            cost = reno.get("adjusted_cost")
-            if cost is None:
-                default_cost = renovation_rates.get(reno.get("type"))
-                cost = default_cost if default_cost is not None else 0
-            renovation_total += cost
-            costs["breakdown"][f"renovation_{reno.get('type', 'custom')}"] = cost
-        costs["breakdown"]["renovation_total"] = renovation_total
-        costs["total_investment_cost"] += renovation_total
-        costs["initial_outlay_year0"] += renovation_total # Assume renovations happen at year 0
+        renovation_rates = _region_rates(country, city).renovation_rates
+        # User-adjusted cost where given, else the region's default for the renovation type
+        reno_costs = [cost if (cost := reno.get("adjusted_cost")) is not None else renovation_rates.get(reno.get("type"), 0)
+                      for reno in renovations]
+        renovation_total = math.fsum(reno_costs)
+        costs.breakdown.update(zip([f"renovation_{reno.get('type', 'custom')}" for reno in renovations], reno_costs))
+        costs.breakdown["renovation_total"] = renovation_total
+        costs.total_investment_cost += renovation_total
+        costs.initial_outlay_year0 += renovation_total # Assume renovations happen at year 0
 
     if prop_type == "under_construction" and payment_schedule:
-        costs["breakdown"]["payment_schedule"] = payment_schedule
+        costs.breakdown["payment_schedule"] = payment_schedule
         remaining_payment_fraction = 1.0 - initial_payment_fraction
-        costs["breakdown"]["remaining_payments_value"] = price * remaining_payment_fraction
+        costs.breakdown["remaining_payments_value"] = price * remaining_payment_fraction
 
-    costs["breakdown"]["total_investment_cost"] = costs["total_investment_cost"]
-    costs["breakdown"]["initial_outlay_year0"] = costs["initial_outlay_year0"]
+    costs.breakdown["total_investment_cost"] = costs.total_investment_cost
+    costs.breakdown["initial_outlay_year0"] = costs.initial_outlay_year0
 
     return costs
 
+def _cache_key(value):
+    """JSON of a cached calculation's input; decoding it gives the input back with its keys in submitted order.
+
+    Encoded with the json module: integers of any size are kept exact, and non-finite floats raise
+    ValueError instead of being written as null, where they would collide with inputs holding None.
+    """
+    return json.dumps(value, allow_nan=False, default=dict) # default=dict encodes frozen mappings
+
+@lru_cache(maxsize=256)
+def _cached_purchase_costs(inputs_key, country, city):
+    return calculate_purchase_costs(json.loads(inputs_key), country, city)
+
+def _purchase_costs_for(inputs, country, city):
+    """calculate_purchase_costs memoized on the JSON of the property inputs."""
+    try:
+        inputs_key = _cache_key(inputs)
+    except (TypeError, ValueError):
+        return calculate_purchase_costs(inputs, country, city)
+    cached = _cached_purchase_costs(inputs_key, country, city)
+    # The breakdown is the only mutable part callers could touch; its values are shared read-only
+    return PurchaseCosts(cached.total_investment_cost, cached.initial_outlay_year0, dict(cached.breakdown))
+
+def _running_cost_keys(*names):
+    """Breakdown keys of a country's annual running cost lines plus their total, and the matching "_total" keys."""
+    annual_keys = names + ("total_annual_running_costs",)
+    return annual_keys, tuple(key + "_total" for key in annual_keys)
+
+def _running_costs_spain(rates, price):
+    cadastral_value_proxy = price * 0.5 # USER INPUT NEEDED
+    return (
+        cadastral_value_proxy * rates.running_ibi_rate, # property_tax_ibi
+        rates.running_community_fee_monthly * 12 # community_fees
+    )
+
+def _running_costs_denmark(rates, price):
+    land_value_proxy = price * 0.3 # USER INPUT NEEDED
+    property_value_proxy = price # USER INPUT NEEDED
+    return (
+        land_value_proxy * rates.running_property_tax_ejendomsskat, # property_tax_ejendomsskat
+        property_value_proxy * rates.running_property_value_tax_ejendomsværdiskat, # property_value_tax_ejendomsværdiskat
+        rates.running_community_fee_monthly * 12 # community_fees
+    )
+
+# Per-country annual running cost lines: the handler returns the line amounts in breakdown key order
+_RUNNING_COSTS = {
+    "spain": (_running_costs_spain, _running_cost_keys("property_tax_ibi", "community_fees")),
+    "denmark": (_running_costs_denmark, _running_cost_keys(
+        "property_tax_ejendomsskat", "property_value_tax_ejendomsværdiskat", "community_fees")),
+}
+_NO_RUNNING_COST_KEYS = _running_cost_keys()
+
 def calculate_running_costs(inputs, country, city, years):
     """Calculates total running costs over the holding period (excluding loan interest)."""
-    costs = {"total": 0, "breakdown_annual": {}, "breakdown_total": {}}
+    costs = RunningCosts()
     price = inputs.get("new_flat_price", 0)
     prop_type = inputs.get("property_type", "new")
     completion_years = inputs.get("construction_completion_years", 0) if prop_type == "under_construction" else 0
     effective_years = max(0, years - completion_years)
     if price <= 0 or effective_years <= 0: return costs
     
-    annual_total = 0
-    if country == "spain":
-        cadastral_value_proxy = price * 0.5 # USER INPUT NEEDED
-        ibi_annual = cadastral_value_proxy * get_rate(country, city, "running_ibi_rate")
-        costs["breakdown_annual"]["property_tax_ibi"] = ibi_annual
-        annual_total += ibi_annual
-        community_fee_monthly = get_rate(country, city, "running_community_fee_monthly")
-        community_fee_annual = community_fee_monthly * 12
-        costs["breakdown_annual"]["community_fees"] = community_fee_annual
-        annual_total += community_fee_annual
-    elif country == "denmark":
-        land_value_proxy = price * 0.3 # USER INPUT NEEDED
-        ejendomsskat_annual = land_value_proxy * get_rate(country, city, "running_property_tax_ejendomsskat")
-        costs["breakdown_annual"]["property_tax_ejendomsskat"] = ejendomsskat_annual
-        annual_total += ejendomsskat_annual
-        property_value_proxy = price # USER INPUT NEEDED
-        ejendomsværdiskat_annual = property_value_proxy * get_rate(country, city, "running_property_value_tax_ejendomsværdiskat")
-        costs["breakdown_annual"]["property_value_tax_ejendomsværdiskat"] = ejendomsværdiskat_annual
-        annual_total += ejendomsværdiskat_annual
-        community_fee_monthly = get_rate(country, city, "running_community_fee_monthly")
-        community_fee_annual = community_fee_monthly * 12
-        costs["breakdown_annual"]["community_fees"] = community_fee_annual
-        annual_total += community_fee_annual
-
-    costs["breakdown_annual"]["total_annual_running_costs"] = annual_total
-    costs["total"] = annual_total * effective_years
-    for key, value in costs["breakdown_annual"].items():
-        costs["breakdown_total"][key + "_total"] = value * effective_years
+    handler = _RUNNING_COSTS.get(country)
+    if handler:
+        annual_costs, (annual_keys, total_keys) = handler
+        annuals = annual_costs(_region_rates(country, city), price)
+    else:
+        annuals, (annual_keys, total_keys) = (), _NO_RUNNING_COST_KEYS
+    annual_total = sum(annuals)
+    annuals += (annual_total,)
+
+    costs.total = annual_total * effective_years
+    costs.breakdown_annual = dict(zip(annual_keys, annuals))
+    costs.breakdown_total = dict(zip(total_keys, [value * effective_years for value in annuals]))
     return costs
 
 def calculate_selling_costs(country, city, selling_price, purchase_price, purchase_costs_investment_total, years_held, beckham_law_active=False):
     """Calculates costs associated with selling the property."""
-    costs = {"total": 0, "breakdown": {}}
-    if selling_price <= 0 or purchase_price <= 0: return costs
-    
-    agency_fee = selling_price * get_rate(country, city, "selling_agency_fee_rate")
-    costs["breakdown"]["selling_agency_fee"] = agency_fee
-    costs["total"] += agency_fee
+    _, costs = _selling_costs_vec(country, city, np.array([selling_price], dtype=np.float64), purchase_price,
+                                  purchase_costs_investment_total, beckham_law_active)
+    return costs[0]
 
-    capital_gain = selling_price - purchase_costs_investment_total
-    costs["breakdown"]["capital_gain"] = capital_gain
+def _selling_costs_vec(country, city, selling_prices, purchase_price, purchase_costs_investment_total, beckham_law_active=False):
+    """Calculates selling costs for an array of selling prices in one vectorized pass.
+
+    Returns the array of total selling costs and the per-price SellingCosts (as returned by calculate_selling_costs).
+    """
+    rates = _region_rates(country, city)
+    agency_fees = selling_prices * rates.selling_agency_fee_rate
+    capital_gains = selling_prices - purchase_costs_investment_total
     
     # Capital gains tax calculation
-    capital_gains_tax = 0
-    
     # For Denmark, capital gains tax is 0 when tax resident in Denmark
-    if country == "denmark":
-        # No capital gains tax for Danish properties when tax resident in Denmark
-        costs["breakdown"]["capital_gains_tax_note"] = "No capital gains tax applied (assumes tax residence in Denmark)"
-        capital_gains_tax = 0
-    elif country == "spain":
+    capital_gains_taxes = np.zeros_like(selling_prices)
+    plusvalia_municipal = 0
+    if country == "spain":
         if beckham_law_active:
             # Beckham law flat rate on capital gains
-            beckham_rate = get_rate(country, city, "beckham_law_tax_rate")
-            capital_gains_tax = capital_gain * beckham_rate if capital_gain > 0 else 0
-            costs["breakdown"]["capital_gains_tax_beckham"] = capital_gains_tax
+            beckham_rate = rates.beckham_law_tax_rate
+            capital_gains_taxes = np.where(capital_gains > 0, capital_gains * beckham_rate, 0.0)
         else:
-            # Standard progressive capital gains tax
-            rates_table = get_rate(country, city, "capital_gains_tax_rate_spain")
-            capital_gains_tax = calculate_progressive_tax(capital_gain, rates_table) if capital_gain > 0 else 0
-            costs["breakdown"]["capital_gains_tax_standard"] = capital_gains_tax
-    
-    costs["breakdown"]["capital_gains_tax"] = capital_gains_tax
-    costs["total"] += capital_gains_tax
-    
-    if country == "spain":
-        plusvalia_municipal = get_rate(country, city, "selling_plusvalia_municipal")
-        costs["breakdown"]["plusvalia_municipal"] = plusvalia_municipal
-        costs["total"] += plusvalia_municipal
+            # Standard progressive capital gains tax (zero for non-positive gains)
+            rates_table = rates.capital_gains_tax_rate_spain
+            capital_gains_taxes = calculate_progressive_tax_vec(capital_gains, rates_table)
+        plusvalia_municipal = rates.selling_plusvalia_municipal
     
-    # Calculate costs_gains but don't return it prematurely
-    costs_gains = max(0, selling_price - purchase_costs_investment_total)
-    costs["breakdown"]["costs_gains"] = costs_gains
+    totals = agency_fees + capital_gains_taxes + plusvalia_municipal
+    valid = (selling_prices > 0) & (purchase_price > 0)
+    totals = np.where(valid, totals, 0.0)
+
+    costs_list = []
+    for is_valid, agency_fee, capital_gain, capital_gains_tax, total in zip(
+            valid.tolist(), agency_fees.tolist(), capital_gains.tolist(), capital_gains_taxes.tolist(), totals.tolist()):
+        if not is_valid:
+            costs_list.append(SellingCosts())
+            continue
+        breakdown = {"selling_agency_fee": agency_fee, "capital_gain": capital_gain}
+        if country == "denmark":
+            # No capital gains tax for Danish properties when tax resident in Denmark
+            breakdown["capital_gains_tax_note"] = "No capital gains tax applied (assumes tax residence in Denmark)"
+        elif country == "spain":
+            breakdown["capital_gains_tax_beckham" if beckham_law_active else "capital_gains_tax_standard"] = capital_gains_tax
+        breakdown["capital_gains_tax"] = capital_gains_tax
+        if country == "spain":
+            breakdown["plusvalia_municipal"] = plusvalia_municipal
+        breakdown["costs_gains"] = max(0, capital_gain)
+        costs_list.append(SellingCosts(total, breakdown))
     
-    return costs
+    return totals, costs_list
+
+def _compounded_total(first_year_amount, annual_increment, years):
+    """Sum of first_year_amount * (1 + annual_increment) ** year over years 0..years-1, in closed form."""
+    if annual_increment == 0:
+        return first_year_amount * years
+    if annual_increment <= -1: # log1p is undefined here, fall back to the generic power
+        return first_year_amount * ((1 + annual_increment) ** years - 1) / annual_increment
+    # expm1/log1p keep precision for small increments, where (1 + g) ** n - 1 would cancel
+    return first_year_amount * math.expm1(years * math.log1p(annual_increment)) / annual_increment
 
 def calculate_renting_scenario_cost(renting_inputs, years_to_sell):
     """Calculates the total cost of renting over the specified period."""
@@ -366,23 +607,14 @@ def calculate_renting_scenario_cost(renting_inputs, years_to_sell):
         if years_to_sell <= 0:
             return {"error": "Years to sell must be greater than 0"}
         
-        # Calculate costs with annual increments
-        total_rent = 0
-        total_water = 0
-        total_utilities = 0
-        total_parking = 0
+        # Whole years only, as with a per-year loop (a float raises TypeError)
+        years = operator.index(years_to_sell)
         
-        # Calculate costs for each year with appropriate increments
-        for year in range(years_to_sell):
-            year_rent = monthly_rent * 12 * ((1 + annual_rent_increment) ** year)
-            year_water = monthly_water * 12 * ((1 + annual_water_increment) ** year)
-            year_utilities = monthly_utilities * 12 * ((1 + annual_utilities_increment) ** year)
-            year_parking = monthly_parking * 12 * ((1 + annual_parking_increment) ** year)
-            
-            total_rent += year_rent
-            total_water += year_water
-            total_utilities += year_utilities
-            total_parking += year_parking
+        # Calculate costs with annual increments (geometric series over the years)
+        total_rent = _compounded_total(monthly_rent * 12, annual_rent_increment, years)
+        total_water = _compounded_total(monthly_water * 12, annual_water_increment, years)
+        total_utilities = _compounded_total(monthly_utilities * 12, annual_utilities_increment, years)
+        total_parking = _compounded_total(monthly_parking * 12, annual_parking_increment, years)
         
         total_renting_cost = total_rent + total_water + total_utilities + total_parking
         
@@ -416,8 +648,38 @@ def calculate_renting_scenario_cost(renting_inputs, years_to_sell):
     except (ValueError, TypeError) as e:
         return {"error": f"Error calculating renting costs: {str(e)}"}
 
+@lru_cache(maxsize=4096)
+def _cached_result(key):
+    # Stored encoded: decoding a fresh copy per hit is cheaper than deep-copying, and keeps the entry immutable
+    result = _perform_calculation_impl(json.loads(key))
+    try:
+        return orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError: # Integers wider than 64 bits; cached too, so the store isn't retried
+        return None
+
 def perform_calculation_for_scenario(calculation_input):
-    """Main calculation function that orchestrates all sub-calculations for a scenario."""
+    """Memoized entry point: repeated identical inputs are served from the cache.
+
+    Each call returns its own copy decoded from JSON, as the API serves it: the cost dataclasses come
+    back as dicts, and non-finite results (only reachable through overflowing inputs) as None. The
+    input is also read back from JSON, so dict keys that aren't strings arrive as strings. Inputs
+    holding non-finite floats or values JSON can't encode, and results with integers wider than
+    64 bits, skip the cache and are returned as _perform_calculation_impl builds them.
+    """
+    try:
+        key = _cache_key(calculation_input)
+    except (TypeError, ValueError):
+        return _perform_calculation_impl(calculation_input)
+    encoded = _cached_result(key)
+    if encoded is None:
+        return _perform_calculation_impl(calculation_input)
+    return orjson.loads(encoded)
+
+def _perform_calculation_impl(calculation_input):
+    """Main calculation function that orchestrates all sub-calculations for a scenario.
+
+    calculation_input is treated as read-only, so callers may pass shared or frozen mappings.
+    """
     # Extract inputs
     personal_finance = calculation_input.get("personal_finance", {})
     scenario_settings = calculation_input.get("scenario_settings", {})
@@ -437,8 +699,8 @@ def perform_calculation_for_scenario(calculation_input):
     if price <= 0:
         return {"error": "Property price must be greater than 0"}
     
-    # Calculate purchase costs
-    purchase_costs = calculate_purchase_costs(inputs, country, city)
+    # Calculate purchase costs (independent of the holding period, so reused when only that changes)
+    purchase_costs = _purchase_costs_for(inputs, country, city)
     
     # Calculate running costs over the holding period
     running_costs = calculate_running_costs(inputs, country, city, years_to_sell)
@@ -446,76 +708,72 @@ def perform_calculation_for_scenario(calculation_input):
     # Calculate loan interest costs if applicable
     loan_details = inputs.get("loan_details", {})
     loan_interest_costs = 0
+    monthly_payment = None
     if loan_details and loan_details.get("amount", 0) > 0:
         loan_amount = loan_details.get("amount", 0)
         interest_rate = loan_details.get("interest_rate", 0)
         term_years = loan_details.get("term_years", 30)
         
-        loan_interest_costs = calculate_total_interest_paid(
-            loan_amount, interest_rate, term_years, years_to_sell
-        )
-        loan_details["total_interest_paid"] = loan_interest_costs
+        loan = calculate_loan(loan_amount, interest_rate, term_years, years_to_sell)
+        loan_interest_costs = loan.interest
+        # Copy rather than write into the caller's inputs
+        loan_details = {**loan_details, "total_interest_paid": loan_interest_costs}
+        # The breakdown reports the payment for the loan as submitted, so not for a defaulted term
+        if loan.monthly_payment and loan_details.get("term_years", 0) > 0:
+            monthly_payment = loan.monthly_payment
     
     # Calculate property value at sale time under different scenarios
-    avg_appreciation_rate = get_rate(country, city, "avg_appreciation_rate")
-    std_dev = get_rate(country, city, "appreciation_std_dev")
+    region_rates = _region_rates(country, city)
+    avg_appreciation_rate = region_rates.avg_appreciation_rate
+    std_dev = region_rates.appreciation_std_dev
     
-    # Calculate selling values for different scenarios
-    selling_values = {
-        "zero_growth": price,  # No appreciation scenario
-        "avg_growth": calculate_future_value(price, avg_appreciation_rate, years_to_sell),
-        "low_risk": calculate_future_value(price, max(0, avg_appreciation_rate - std_dev), years_to_sell),
-        "high_risk": calculate_future_value(price, avg_appreciation_rate + std_dev, years_to_sell)
-    }
+    # Growth rate per scenario, in SCENARIO_NAMES order
+    rates = np.array([0.0, avg_appreciation_rate, max(0, avg_appreciation_rate - std_dev), avg_appreciation_rate + std_dev])
+    # Selling price for every scenario in one vectorized compound-growth pass
+    selling_prices = price * np.exp(years_to_sell * np.log1p(rates))
     
     # Store growth rates for frontend display
-    growth_rates = {
-        "zero_growth": 0,
-        "avg_growth": avg_appreciation_rate,
-        "low_risk": max(0, avg_appreciation_rate - std_dev),
-        "high_risk": avg_appreciation_rate + std_dev
-    }
+    growth_rates = dict(zip(SCENARIO_NAMES, rates.tolist()))
     
     # Debug log to ensure growth rates are defined
-    print(f"Growth rates for {country}/{city}: {growth_rates}")
+    _log.debug("Growth rates for %s/%s: %s", country, city, growth_rates)
     
-    # Calculate selling costs and capital gains tax for each scenario
-    selling_scenarios = {}
+    # Calculate selling costs and capital gains tax for all scenarios at once
     beckham_law_active = inputs.get("beckham_law_active", False)
+    selling_totals, selling_costs_list = _selling_costs_vec(
+        country, city, selling_prices, price,
+        purchase_costs.total_investment_cost, beckham_law_active
+    )
     
-    # Import the detailed breakdown service
-    from src.services.detailed_breakdown_service import create_detailed_breakdown
-    
-    # Create detailed breakdowns for each scenario
-    detailed_breakdowns = {}
+    # Calculate win/loss (profit/loss) for all scenarios
+    win_losses = selling_prices - purchase_costs.total_investment_cost - running_costs.total - loan_interest_costs - selling_totals
     
-    for scenario_name, selling_price in selling_values.items():
-        selling_costs = calculate_selling_costs(
-            country, city, selling_price, price, 
-            purchase_costs["total_investment_cost"], 
-            years_to_sell, beckham_law_active
-        )
-        
-        # Calculate win/loss (profit/loss)
-        win_loss = selling_price - purchase_costs["total_investment_cost"] - running_costs["total"] - loan_interest_costs - selling_costs["total"]
-        
-        selling_scenarios[scenario_name] = {
+    # Scenario values stay parallel sequences in SCENARIO_NAMES order; dicts are only built for the response
+    selling_prices = selling_prices.tolist()
+    win_losses = win_losses.tolist()
+    selling_scenarios = {
+        scenario_name: {
             "selling_price": selling_price,
             "selling_costs": selling_costs,
             "win_loss_eur": win_loss
         }
-        
-        # Create detailed breakdown for this scenario
-        detailed_breakdowns[scenario_name] = create_detailed_breakdown(
-            purchase_costs=purchase_costs,
-            running_costs=running_costs,
-            selling_costs=selling_costs,
-            loan_details=loan_details,
-            years_to_sell=years_to_sell,
-            price=price,
-            selling_price=selling_price,
-            win_loss=win_loss
-        )
+        for scenario_name, selling_price, selling_costs, win_loss in zip(
+            SCENARIO_NAMES, selling_prices, selling_costs_list, win_losses)
+    }
+    
+    # Create detailed breakdowns for all scenarios, sharing the sections they have in common
+    detailed_breakdowns = create_detailed_breakdowns(
+        purchase_costs=purchase_costs,
+        running_costs=running_costs,
+        loan_details=loan_details,
+        years_to_sell=years_to_sell,
+        price=price,
+        scenario_names=SCENARIO_NAMES,
+        selling_prices=selling_prices,
+        selling_costs=selling_costs_list,
+        win_losses=win_losses,
+        monthly_payment=monthly_payment
+    )
     
     # Prepare the final result
     result = {
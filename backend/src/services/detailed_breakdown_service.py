@@ -1,147 +1,175 @@
-def create_detailed_breakdown(purchase_costs, running_costs, selling_costs, loan_details, years_to_sell, price, selling_price, win_loss, index_adjusted_profit=None):
+def create_detailed_breakdown(purchase_costs, running_costs, selling_costs, loan_details, years_to_sell, price, selling_price, win_loss, index_adjusted_profit=None, monthly_payment=None):
     """
     Creates a structured detailed breakdown object from various cost calculations.
-    
+
     Args:
-        purchase_costs: Dictionary containing purchase cost breakdown
-        running_costs: Dictionary containing running cost breakdown
-        selling_costs: Dictionary containing selling cost breakdown
+        purchase_costs: PurchaseCosts with the purchase cost breakdown
+        running_costs: RunningCosts with the running cost breakdown
+        selling_costs: SellingCosts with the selling cost breakdown
         loan_details: Dictionary containing loan details
         years_to_sell: Number of years property is held
         price: Purchase price of property
         selling_price: Selling price of property
         win_loss: Overall profit/loss
         index_adjusted_profit: Profit/loss adjusted against renting baseline (optional)
-        
+        monthly_payment: Calculated monthly loan payment (optional)
+
     Returns:
         Dictionary with structured detailed breakdown
     """
-    detailed_breakdown = {
-        "purchase_costs": {},
-        "loan_costs": {},
-        "running_costs": {},
-        "selling_costs": {},
-        "outcome": {}
+    return {
+        "purchase_costs": _purchase_costs_section(purchase_costs),
+        "loan_costs": _loan_costs_section(loan_details, monthly_payment),
+        "running_costs": _running_costs_section(running_costs, years_to_sell),
+        "selling_costs": _selling_costs_section(selling_costs),
+        "outcome": _outcome_section(purchase_costs, running_costs, selling_costs, loan_details,
+                                    price, selling_price, win_loss, index_adjusted_profit)
     }
-    
-    # Purchase costs section
-    if purchase_costs and "breakdown" in purchase_costs:
+
+def create_detailed_breakdowns(purchase_costs, running_costs, loan_details, years_to_sell, price, scenario_names, selling_prices, selling_costs, win_losses, monthly_payment=None):
+    """
+    Creates the detailed breakdown of every selling scenario in one call.
+
+    The purchase, loan and running cost sections are the same for every scenario, so they
+    are built once; only the selling costs and outcome sections are built per scenario.
+
+    Args:
+        purchase_costs, running_costs, loan_details, years_to_sell, price: As for create_detailed_breakdown
+        scenario_names: Name of each scenario
+        selling_prices: Selling price of each scenario, in scenario_names order
+        selling_costs: SellingCosts of each scenario, in scenario_names order
+        win_losses: Profit/loss of each scenario, in scenario_names order
+        monthly_payment: As for create_detailed_breakdown
+
+    Returns:
+        Dictionary of scenario name to detailed breakdown (as returned by create_detailed_breakdown)
+    """
+    purchase_section = _purchase_costs_section(purchase_costs)
+    loan_section = _loan_costs_section(loan_details, monthly_payment)
+    running_section = _running_costs_section(running_costs, years_to_sell)
+
+    detailed_breakdowns = {}
+    for scenario_name, selling_price, scenario_selling_costs, win_loss in zip(scenario_names, selling_prices, selling_costs, win_losses):
+        detailed_breakdowns[scenario_name] = {
+            # Shallow copies: each scenario owns its sections, as with create_detailed_breakdown
+            "purchase_costs": dict(purchase_section),
+            "loan_costs": dict(loan_section),
+            "running_costs": dict(running_section),
+            "selling_costs": _selling_costs_section(scenario_selling_costs),
+            "outcome": _outcome_section(purchase_costs, running_costs, scenario_selling_costs, loan_details,
+                                        price, selling_price, win_loss)
+        }
+    return detailed_breakdowns
+
+# Purchase breakdown lines copied to the detailed breakdown as they are
+_TAX_AND_FEE_FIELDS = frozenset({"purchase_tax_vat", "purchase_tax_ajd", "purchase_tax_itp",
+                                 "purchase_tax_tinglysningsafgift", "notary_fee", "registry_fee", "lawyer_fee"})
+
+def _purchase_costs_section(purchase_costs):
+    section = {}
+    if purchase_costs:
         # Property price
-        detailed_breakdown["purchase_costs"]["property_price"] = purchase_costs["breakdown"].get("property_price", 0)
-        
-        # Taxes
-        tax_fields = ["purchase_tax_vat", "purchase_tax_ajd", "purchase_tax_itp", 
-                     "purchase_tax_tinglysningsafgift"]
-        for field in tax_fields:
-            if field in purchase_costs["breakdown"]:
-                detailed_breakdown["purchase_costs"][field] = purchase_costs["breakdown"][field]
-        
-        # Fees
-        fee_fields = ["notary_fee", "registry_fee", "lawyer_fee"]
-        for field in fee_fields:
-            if field in purchase_costs["breakdown"]:
-                detailed_breakdown["purchase_costs"][field] = purchase_costs["breakdown"][field]
-        
-        # Renovations
+        section["property_price"] = purchase_costs.breakdown.get("property_price", 0)
+
+        # Taxes, fees and renovations, in one pass over the breakdown (taxes and fees precede renovations)
         renovation_total = 0
-        for key, value in purchase_costs["breakdown"].items():
-            if key.startswith("renovation_") and key != "renovation_total":
-                detailed_breakdown["purchase_costs"][key] = value
+        for key, value in purchase_costs.breakdown.items():
+            if key in _TAX_AND_FEE_FIELDS:
+                section[key] = value
+            elif key.startswith("renovation_") and key != "renovation_total":
+                section[key] = value
                 renovation_total += value
-        
+
         if renovation_total > 0:
-            detailed_breakdown["purchase_costs"]["renovation_total"] = renovation_total
-        
+            section["renovation_total"] = renovation_total
+
         # Subtotal
-        detailed_breakdown["purchase_costs"]["total_purchase_costs"] = purchase_costs["total_investment_cost"]
-    
-    # Loan costs section
+        section["total_purchase_costs"] = purchase_costs.total_investment_cost
+    return section
+
+def _loan_costs_section(loan_details, monthly_payment=None):
+    section = {}
     if loan_details:
         loan_amount = loan_details.get("amount", 0)
         interest_rate = loan_details.get("interest_rate", 0)
         term_years = loan_details.get("term_years", 0)
-        
-        detailed_breakdown["loan_costs"]["loan_amount"] = loan_amount
-        detailed_breakdown["loan_costs"]["interest_rate"] = interest_rate
-        detailed_breakdown["loan_costs"]["term_years"] = term_years
-        
-        # Calculate monthly payment if not provided
-        if loan_amount > 0 and interest_rate > 0 and term_years > 0:
-            import math
-            monthly_rate = interest_rate / 12
-            num_payments = term_years * 12
-            try:
-                denominator = math.pow(1 + monthly_rate, num_payments) - 1
-                if denominator != 0:
-                    monthly_payment = loan_amount * (monthly_rate * math.pow(1 + monthly_rate, num_payments)) / denominator
-                    detailed_breakdown["loan_costs"]["monthly_payment"] = round(monthly_payment, 2)
-            except (OverflowError, ValueError):
-                pass  # Skip if calculation fails
-        
+
+        section["loan_amount"] = loan_amount
+        section["interest_rate"] = interest_rate
+        section["term_years"] = term_years
+
+        # Monthly payment, as calculated alongside the interest (never taken from the submitted loan details)
+        if monthly_payment is not None:
+            section["monthly_payment"] = round(monthly_payment, 2)
+
         # Total interest paid
         if "total_interest_paid" in loan_details:
-            detailed_breakdown["loan_costs"]["total_interest_paid"] = loan_details["total_interest_paid"]
-        
+            section["total_interest_paid"] = loan_details["total_interest_paid"]
+
         # Subtotal (same as total interest paid)
         if "total_interest_paid" in loan_details:
-            detailed_breakdown["loan_costs"]["total_loan_costs"] = loan_details["total_interest_paid"]
-    
-    # Running costs section
+            section["total_loan_costs"] = loan_details["total_interest_paid"]
+    return section
+
+def _running_costs_section(running_costs, years_to_sell):
+    section = {}
     if running_costs:
         # Annual costs
-        if "breakdown_annual" in running_costs:
-            for key, value in running_costs["breakdown_annual"].items():
-                if key != "total_annual_running_costs":
-                    detailed_breakdown["running_costs"][f"{key}_annual"] = value
-        
+        for key, value in running_costs.breakdown_annual.items():
+            if key != "total_annual_running_costs":
+                section[f"{key}_annual"] = value
+
         # Total costs over holding period
-        if "breakdown_total" in running_costs:
-            for key, value in running_costs["breakdown_total"].items():
-                detailed_breakdown["running_costs"][key] = value
-        
+        for key, value in running_costs.breakdown_total.items():
+            section[key] = value
+
         # Years held
-        detailed_breakdown["running_costs"]["years_held"] = years_to_sell
-        
+        section["years_held"] = years_to_sell
+
         # Subtotal
-        detailed_breakdown["running_costs"]["total_running_costs"] = running_costs.get("total", 0)
-    
-    # Selling costs section
+        section["total_running_costs"] = running_costs.total
+    return section
+
+def _selling_costs_section(selling_costs):
+    section = {}
     if selling_costs:
         # Agency fee
-        if "breakdown" in selling_costs and "selling_agency_fee" in selling_costs["breakdown"]:
-            detailed_breakdown["selling_costs"]["selling_agency_fee"] = selling_costs["breakdown"]["selling_agency_fee"]
-        
+        if "selling_agency_fee" in selling_costs.breakdown:
+            section["selling_agency_fee"] = selling_costs.breakdown["selling_agency_fee"]
+
         # Capital gains tax
-        if "breakdown" in selling_costs and "capital_gains_tax" in selling_costs["breakdown"]:
-            detailed_breakdown["selling_costs"]["capital_gains_tax"] = selling_costs["breakdown"]["capital_gains_tax"]
-        
+        if "capital_gains_tax" in selling_costs.breakdown:
+            section["capital_gains_tax"] = selling_costs.breakdown["capital_gains_tax"]
+
         # Other selling costs
-        if "breakdown" in selling_costs:
-            for key, value in selling_costs["breakdown"].items():
-                if key not in ["selling_agency_fee", "capital_gains_tax"]:
-                    detailed_breakdown["selling_costs"][key] = value
-        
+        for key, value in selling_costs.breakdown.items():
+            if key not in ["selling_agency_fee", "capital_gains_tax"]:
+                section[key] = value
+
         # Subtotal
-        detailed_breakdown["selling_costs"]["total_selling_costs"] = selling_costs.get("total", 0)
-    
+        section["total_selling_costs"] = selling_costs.total
+    return section
+
+def _outcome_section(purchase_costs, running_costs, selling_costs, loan_details, price, selling_price, win_loss, index_adjusted_profit=None):
+    section = {}
     # Financial outcome section
-    detailed_breakdown["outcome"]["purchase_price"] = price
-    detailed_breakdown["outcome"]["total_investment"] = purchase_costs.get("total_investment_cost", price)
-    detailed_breakdown["outcome"]["selling_price"] = selling_price
-    
+    section["purchase_price"] = price
+    section["total_investment"] = purchase_costs.total_investment_cost
+    section["selling_price"] = selling_price
+
     # Total costs (running + loan interest + selling)
     total_costs = (
-        running_costs.get("total", 0) + 
-        (loan_details.get("total_interest_paid", 0) if loan_details else 0) + 
-        selling_costs.get("total", 0)
+        running_costs.total +
+        (loan_details.get("total_interest_paid", 0) if loan_details else 0) +
+        selling_costs.total
     )
-    detailed_breakdown["outcome"]["total_costs"] = total_costs
-    
+    section["total_costs"] = total_costs
+
     # Raw profit/loss
-    detailed_breakdown["outcome"]["raw_profit_loss"] = win_loss
-    
+    section["raw_profit_loss"] = win_loss
+
     # Index adjusted profit/loss (if provided)
     if index_adjusted_profit is not None:
-        detailed_breakdown["outcome"]["index_adjusted_profit_loss"] = index_adjusted_profit
-    
-    return detailed_breakdown
+        section["index_adjusted_profit_loss"] = index_adjusted_profit
+
+    return section
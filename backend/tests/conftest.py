@@ -0,0 +1,7 @@
+# /home/ubuntu/property_analyzer/backend/tests/conftest.py
+
+import sys
+from pathlib import Path
+
+# Add the src directory to the Python path once for every test module, so they can import services directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))